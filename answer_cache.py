@@ -0,0 +1,101 @@
+import os
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional, Tuple, Union
+
+from supabase import Client
+
+# 缓存配置，可在 .env 中覆盖
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # 缓存有效期（秒）
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))  # 最多缓存的回答数量
+
+CorpusVersion = Union[int, str]  # Supabase 中的语料版本号，或本地快照的版本标识
+CacheKey = Tuple[str, str, CorpusVersion]
+
+@dataclass
+class CachedAnswer:
+    content: str
+    created_at: float
+    hits: int = 0
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题文本：统一大小写、合并空白并去掉末尾标点，使措辞相同的问题命中同一条缓存。"""
+    question = re.sub(r"\s+", " ", question).strip().lower()
+    return question.rstrip("?？!！.。 ")
+
+
+def get_corpus_version(supabase: Client) -> Optional[int]:
+    """读取当前语料版本号；每次写入 site_pages 时由数据库触发器递增。出错时返回 None。"""
+    try:
+        result = supabase.from_('corpus_version') \
+            .select('version') \
+            .eq('id', 1) \
+            .execute()
+        if not result.data:
+            return None
+        return result.data[0]['version']
+    except Exception as e:
+        print(f"获取语料版本时出错: {e}")
+        return None
+
+
+class AnswerCache:
+    """
+    进程内的完整回答缓存。
+    以 (规范化问题, 模型名称, 语料版本) 为键，过期条目在读取时丢弃，
+    超过容量时按最近最少使用（LRU）淘汰。
+    所有 Streamlit 会话线程共用同一个实例，读写都在锁内进行。
+    """
+
+    def __init__(self, ttl: float = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(question: str, model_name: str, corpus_version: CorpusVersion) -> CacheKey:
+        return (normalize_question(question), model_name, corpus_version)
+
+    def get(self, key: CacheKey) -> Optional[CachedAnswer]:
+        """返回未过期的缓存回答，并将其标记为最近使用。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry.created_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            return entry
+
+    def put(self, key: CacheKey, content: str):
+        """写入回答，必要时淘汰最久未使用的条目。"""
+        if not content:
+            return
+        with self._lock:
+            self._entries[key] = CachedAnswer(content=content, created_at=time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+async def replay_answer(content: str, chunk_size: int = 24, delay: float = 0.005) -> AsyncIterator[str]:
+    """将缓存的回答按小块重新以流的形式输出，使 UI 的渲染路径与实时回答一致。"""
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
+        await asyncio.sleep(delay)
@@ -6,13 +6,16 @@ from xml.etree import ElementTree
 from datetime import datetime, timezone
 from urllib.parse import urlparse
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from ollama import AsyncClient
 from openai import AsyncOpenAI
 from supabase import create_client, Client
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 
+from dedup import ChunkSignatureIndex, CanonicalChunk
+from memory_dispatcher import MemoryAdaptiveDispatcher
+
 # 初始化Ollama,OpenAI和Supabase客户端
 ollama_client = AsyncClient(host=os.getenv('OLLAMA_SERVER_URL'))
 supabase: Client = create_client(
@@ -20,15 +23,27 @@ supabase: Client = create_client(
     os.getenv("SUPABASE_SERVICE_KEY")
 )
 
+# 要爬取的文档站点：数据源名称 -> sitemap URL
+# 每个数据源在 site_pages 中拥有独立的分区和向量索引，爬取新的文档时在此处添加
+DOC_SITES: Dict[str, str] = {
+    "crawl4ai_docs": "https://docs.crawl4ai.com/sitemap.xml",
+}
+
+# 去重配置：签名索引按数据源保存在该目录下，跨多次爬取复用
+DEDUP_INDEX_DIR = os.getenv("DEDUP_INDEX_DIR", ".dedup")
+# link: 重复块仍然存储（不生成嵌入，元数据指向规范块），保持页面内容完整；drop: 直接丢弃重复块
+DEDUP_MODE = os.getenv("DEDUP_MODE", "link")
+
 @dataclass
 class ProcessedChunk:
+    source: str
     url: str
     chunk_number: int
     title: str
     summary: str
     content: str
     metadata: Dict[str, Any]
-    embedding: List[float]
+    embedding: Optional[List[float]]  # 重复块不生成嵌入，为 None
 
 
 def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
@@ -112,7 +127,17 @@ async def get_embedding(text: str) -> List[float]:
         return [0] * 768  # 出错时返回零向量
 
 
-async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChunk:
+def build_metadata(chunk: str, url: str, source: str) -> Dict[str, Any]:
+    """创建文本块的元数据。"""
+    return {
+        "source": source,  # 数据源
+        "chunk_size": len(chunk),  # 文本块的长度
+        "crawled_at": datetime.now(timezone.utc).isoformat(),  # 爬取时间，使用UTC时区并以ISO格式存储
+        "url_path": urlparse(url).path  # 从URL中提取的路径部分
+    }
+
+
+async def process_chunk(chunk: str, chunk_number: int, url: str, source: str) -> ProcessedChunk:
     """处理单个文本块。"""
     # 提取标题和摘要
     extracted = await get_title_and_summary(chunk, url)
@@ -121,15 +146,11 @@ async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChu
     embedding = await get_embedding(chunk)
     
     # 创建元数据
-    metadata = {
-        "source": "crawl4ai_docs",  # 数据源
-        "chunk_size": len(chunk),  # 文本块的长度
-        "crawled_at": datetime.now(timezone.utc).isoformat(),  # 爬取时间，使用UTC时区并以ISO格式存储
-        "url_path": urlparse(url).path  # 从URL中提取的路径部分
-    }
+    metadata = build_metadata(chunk, url, source)
     
     # 返回处理后的文本块对象
     return ProcessedChunk(
+        source=source,  # 文本块所属的数据源
         url=url,  # 原始文本块所在的网页URL
         chunk_number=chunk_number,  # 文本块的顺序编号
         title=extracted['title'],  # 提取的标题
@@ -140,10 +161,27 @@ async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChu
     )
 
 
+def link_duplicate_chunk(chunk: str, chunk_number: int, url: str, source: str, canonical: CanonicalChunk) -> ProcessedChunk:
+    """为重复块创建指向规范块的记录，复用规范块的标题和摘要，不调用 LLM 和嵌入模型。"""
+    metadata = build_metadata(chunk, url, source)
+    metadata["duplicate_of"] = {"url": canonical.url, "chunk_number": canonical.chunk_number}
+    return ProcessedChunk(
+        source=source,
+        url=url,
+        chunk_number=chunk_number,
+        title=canonical.title or "重复内容",
+        summary=canonical.summary or f"与 {canonical.url} 的第 {canonical.chunk_number} 个文本块重复",
+        content=chunk,
+        metadata=metadata,
+        embedding=None  # 不参与向量检索，避免重复内容挤占 top-k 结果
+    )
+
+
 async def insert_chunk(chunk: ProcessedChunk):
     """将处理后的文本块插入到Supabase中。"""
     try:
         data = {
+            "source": chunk.source,
             "url": chunk.url,
             "chunk_number": chunk.chunk_number,
             "title": chunk.title,
@@ -164,28 +202,57 @@ async def insert_chunk(chunk: ProcessedChunk):
         return None
 
 
-async def process_and_store_document(url: str, markdown: str):
+async def process_and_store_document(url: str, markdown: str, source: str, dedup_index: ChunkSignatureIndex):
     """处理文档并将文本块并行存储。"""
     # 将文档分割成文本块
     chunks = chunk_text(markdown)
-    
-    # 并行处理文本块
+
+    async def process_and_store_chunk(chunk: str, chunk_number: int):
+        # 在摘要和嵌入之前去重：找出与已处理（或正在处理）的文本块完全或近似重复的块，
+        # 包括同一页面中的重复块；规范块尚未存储时等待其结果
+        canonical = await dedup_index.resolve_canonical(chunk, url, chunk_number)
+        if canonical is not None:
+            # 重复块链接到规范块，或者直接丢弃
+            if DEDUP_MODE == "link":
+                await insert_chunk(link_duplicate_chunk(chunk, chunk_number, url, source, canonical))
+            return
+
+        # 每个文本块处理完立即存储，嵌入向量等数据随即释放，而不是等整页处理完
+        processed = await process_chunk(chunk, chunk_number, url, source)
+        result = await insert_chunk(processed)
+        # 只有成功存储的块才会成为之后重复块的规范块
+        stored = bool(result and result.data)
+        dedup_index.record_summary(url, chunk_number, processed.title, processed.summary, stored)
+
+    # 并行处理并存储文本块，按顺序启动，页面中靠前的块成为规范块
     tasks = [
-        process_chunk(chunk, i, url)  # 创建处理文本块的任务
+        process_and_store_chunk(chunk, i)  # 创建处理文本块的任务
         for i, chunk in enumerate(chunks)
     ]
-    processed_chunks = await asyncio.gather(*tasks)  # 等待所有处理任务完成
-    
-    # 并行存储处理后的文本块
-    insert_tasks = [
-        insert_chunk(chunk)  # 创建存储文本块的任务
-        for chunk in processed_chunks
-    ]
-    await asyncio.gather(*insert_tasks)  # 等待所有存储任务完成
+    await asyncio.gather(*tasks)  # 等待所有处理任务完成
 
 
-async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
-    """并行爬取多个URL，并限制并发数量。"""
+def ensure_source_partition(source: str):
+    """
+    确保数据源在 site_pages 中拥有独立的分区。
+    失败时中止爬取，而不是让该数据源的文本块静默写入默认分区。
+    """
+    try:
+        result = supabase.rpc('create_site_pages_partition', {'source_name': source}).execute()
+    except Exception as e:
+        raise SystemExit(
+            f"创建数据源 {source} 的分区失败: {e}\n"
+            "请确认已执行最新的 site_pages.sql，并使用 SUPABASE_SERVICE_KEY 运行爬虫"
+        )
+    print(f"数据源 {source} 使用分区: {result.data}")
+
+
+async def crawl_parallel(urls: List[str], source: str, max_concurrent: int = 5, max_processing: int = 5):
+    """
+    并行爬取多个URL。
+    并发数由内存自适应调度器根据内存占用动态调整：max_concurrent 是同时打开的浏览器页面数上限，
+    max_processing 是同时在内存中（从爬取到存储完成）的页面数上限。
+    """
     browser_config = BrowserConfig(
         headless=True,
         verbose=False,
@@ -194,35 +261,45 @@ async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
     crawl_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS)
     crawler = AsyncWebCrawler(config=browser_config)
     await crawler.start()
+    # 加载该数据源的去重签名索引
+    dedup_index_path = os.path.join(DEDUP_INDEX_DIR, f"{source}.json")
+    dedup_index = ChunkSignatureIndex.load(dedup_index_path)
+    
+    dispatcher = MemoryAdaptiveDispatcher(max_concurrent, max_processing)
+    total_urls = len(urls)
     
     try:
-        semaphore = asyncio.Semaphore(max_concurrent)
-        
-        async def process_url(url: str):
-            async with semaphore:
-                result = await crawler.arun(
-                    url=url,
-                    config=crawl_config,
-                    session_id="session1"
-                )
-                if result.success:
-                    print(f"成功爬取: {url}")
-                    await process_and_store_document(url, result.markdown_v2.raw_markdown)
-                else:
+        async def process_url(i: int, url: str):
+            # 处理槽位覆盖页面从爬取到存储完成的整个过程，限制同时留在内存中的页面数，
+            # 爬取槽位只覆盖浏览器抓取，限制同时打开的浏览器页面数
+            async with dispatcher.process.slot():
+                # 不共享 session，每次爬取使用独立页面并在完成后关闭，及时释放浏览器内存
+                async with dispatcher.crawl.slot():
+                    print(f"正在处理 URL {i + 1}/{total_urls}: {url}")
+                    result = await crawler.arun(
+                        url=url,
+                        config=crawl_config
+                    )
+                if not result.success:
                     print(f"失败: {url} - 错误: {result.error_message}")
-        
-        # 添加进度提示
-        total_urls = len(urls)
-        for i, url in enumerate(urls):
-            print(f"正在处理 URL {i + 1}/{total_urls}: {url}")
-            await process_url(url)
+                    return
+                print(f"成功爬取: {url}")
+                markdown = result.markdown_v2.raw_markdown
+                del result  # 只保留 markdown，尽早释放完整的爬取结果
+                await process_and_store_document(url, markdown, source, dedup_index)
+
+        async with dispatcher:
+            await asyncio.gather(*(process_url(i, url) for i, url in enumerate(urls)))
     finally:
         await crawler.close()
+        dedup_index.save(dedup_index_path)
+        print("\n摘要:")
+        print(f"  - {dedup_index.stats.report()}")
+        print(f"  - {dispatcher.report()}")
 
 
-def get_docs_urls() -> List[str]:
+def get_docs_urls(sitemap_url: str) -> List[str]:
     """从文档sitemap中获取URL。"""
-    sitemap_url = "https://docs.crawl4ai.com/sitemap.xml"  # 爬取不同的文档时要修改此处的URL
     try:
         response = requests.get(sitemap_url)
         response.raise_for_status()
@@ -240,14 +317,16 @@ def get_docs_urls() -> List[str]:
         return []
 
 async def main():
-    # 从文档中获取URL
-    urls = get_docs_urls()
-    if not urls:
-        print("没有找到要爬取的URL")
-        return
-    
-    print(f"找到 {len(urls)} 个URL要爬取")
-    await crawl_parallel(urls)
+    for source, sitemap_url in DOC_SITES.items():
+        # 从文档中获取URL
+        urls = get_docs_urls(sitemap_url)
+        if not urls:
+            print(f"没有找到要爬取的URL: {source}")
+            continue
+
+        print(f"找到 {len(urls)} 个URL要爬取: {source}")
+        ensure_source_partition(source)
+        await crawl_parallel(urls, source)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
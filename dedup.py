@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Optional, Tuple
+
+# MinHash 参数：64 个哈希函数，分成 16 个 band（每个 4 行）做 LSH，
+# Jaccard 相似度约 0.5 以上的块几乎都会成为候选，再用估计的相似度精确判断
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 5  # 以 5 个词为一个 shingle
+NEAR_DUPLICATE_THRESHOLD = 0.85  # 估计的 Jaccard 相似度达到该值即视为近似重复
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# 固定种子生成的哈希参数，保证签名在多次运行之间可复用
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.sha1(f"a{i}".encode()).digest()[:8], "big") % (_MERSENNE_PRIME - 1) + 1,
+        int.from_bytes(hashlib.sha1(f"b{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME,
+    )
+    for i in range(NUM_PERM)
+]
+
+
+def normalize_chunk(text: str) -> str:
+    """规范化文本块：统一大小写并合并空白，使仅有格式差异的块被视为完全重复。"""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(normalize_chunk(text).encode("utf-8")).hexdigest()
+
+
+def minhash_signature(text: str) -> List[int]:
+    """计算文本块基于词级 shingle 的 MinHash 签名。"""
+    words = normalize_chunk(text).split(" ")
+    if len(words) <= SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "big") for s in shingles]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_similarity(left: List[int], right: List[int]) -> float:
+    """用两个 MinHash 签名中相同位置取值相等的比例估计 Jaccard 相似度。"""
+    return sum(1 for x, y in zip(left, right) if x == y) / NUM_PERM
+
+
+@dataclass
+class CanonicalChunk:
+    """被保留（并已做摘要和嵌入）的规范文本块。"""
+    url: str
+    chunk_number: int
+    content_hash: str
+    signature: List[int]
+    title: Optional[str] = None
+    summary: Optional[str] = None
+    # 只有确认已成功存储的块才会被保存；重复块在链接到未确认的块之前会等待其存储结果
+    confirmed: bool = False
+
+
+@dataclass
+class DedupStats:
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+
+    @property
+    def saved_calls(self) -> int:
+        # 每个重复块省下一次摘要 LLM 调用和一次嵌入调用
+        return self.exact_duplicates + self.near_duplicates
+
+    def report(self) -> str:
+        return (
+            f"去重: 完全重复 {self.exact_duplicates} 个, 近似重复 {self.near_duplicates} 个, "
+            f"节省 LLM 调用 {self.saved_calls} 次, 嵌入调用 {self.saved_calls} 次"
+        )
+
+
+@dataclass
+class ChunkSignatureIndex:
+    """
+    整个爬取过程共享的文本块签名索引。
+    先按内容哈希查找完全重复，再通过 MinHash LSH 分桶查找近似重复；
+    可保存到 JSON 文件，在之后的爬取中继续使用。
+    新登记的块在存储结果出来之前就可以被匹配（同一页面或并发处理的页面中的重复块），
+    resolve_canonical 会等待 record_summary 确认存储成功后才返回它；未确认的块不会被保存。
+    """
+    chunks: List[CanonicalChunk] = field(default_factory=list)
+    stats: DedupStats = field(default_factory=DedupStats)
+
+    def __post_init__(self):
+        self._by_hash: Dict[str, CanonicalChunk] = {}
+        self._by_location: Dict[Tuple[str, int], CanonicalChunk] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[CanonicalChunk]] = {}
+        self._waiters: Dict[int, asyncio.Future] = {}  # 未确认块的 id -> 存储结果
+        for chunk in self.chunks:
+            self._register(chunk)
+
+    @staticmethod
+    def _bands(signature: List[int]):
+        for band in range(LSH_BANDS):
+            yield band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+
+    def _register(self, chunk: CanonicalChunk):
+        self._by_hash.setdefault(chunk.content_hash, chunk)
+        self._by_location[(chunk.url, chunk.chunk_number)] = chunk
+        for key in self._bands(chunk.signature):
+            self._buckets.setdefault(key, []).append(chunk)
+
+    def _unregister(self, chunk: CanonicalChunk):
+        self.chunks.remove(chunk)
+        if self._by_location.get((chunk.url, chunk.chunk_number)) is chunk:
+            del self._by_location[(chunk.url, chunk.chunk_number)]
+        if self._by_hash.get(chunk.content_hash) is chunk:
+            del self._by_hash[chunk.content_hash]
+        for key in self._bands(chunk.signature):
+            self._buckets[key].remove(chunk)
+        self._resolve(chunk, False)
+
+    def _resolve(self, chunk: CanonicalChunk, stored: bool):
+        waiter = self._waiters.pop(id(chunk), None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(stored)
+
+    def find_canonical(self, text: str, url: str, chunk_number: int) -> Optional[CanonicalChunk]:
+        """
+        返回与文本块完全重复或近似重复的规范块；没有重复时将该块登记为新的规范块并返回 None。
+        重新爬取同一位置的块时不会被判定为与自身重复。
+        """
+        location = (url, chunk_number)
+        digest = content_hash(text)
+        exact = self._by_hash.get(digest)
+        if exact is not None and (exact.url, exact.chunk_number) != location:
+            self.stats.exact_duplicates += 1
+            return exact
+
+        signature = minhash_signature(text)
+        candidates = {
+            id(candidate): candidate
+            for key in self._bands(signature)
+            for candidate in self._buckets.get(key, [])
+            if (candidate.url, candidate.chunk_number) != location
+        }
+        best = max(candidates.values(), key=lambda c: estimate_similarity(signature, c.signature), default=None)
+        if best is not None and estimate_similarity(signature, best.signature) >= NEAR_DUPLICATE_THRESHOLD:
+            self.stats.near_duplicates += 1
+            return best
+
+        existing = self._by_location.get(location)
+        if existing is not None:
+            if existing.content_hash == digest:
+                return None
+            # 同一位置的内容已变化，替换旧的签名
+            self._unregister(existing)
+        chunk = CanonicalChunk(url=url, chunk_number=chunk_number, content_hash=digest, signature=signature)
+        self.chunks.append(chunk)
+        self._register(chunk)
+        return None
+
+    async def resolve_canonical(self, text: str, url: str, chunk_number: int) -> Optional[CanonicalChunk]:
+        """
+        与 find_canonical 相同，但匹配到尚未确认存储的规范块时等待其存储结果。
+        规范块存储失败时撤销这次计数并重新匹配，没有其他规范块时由该块自己成为规范块。
+        查找和登记在第一次等待之前同步完成，按顺序启动的任务会按顺序登记。
+        """
+        while True:
+            canonical = self.find_canonical(text, url, chunk_number)
+            if canonical is None or canonical.confirmed:
+                return canonical
+            waiter = self._waiters.get(id(canonical))
+            if waiter is None:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters[id(canonical)] = waiter
+            if await waiter:
+                return canonical
+            if canonical.content_hash == content_hash(text):
+                self.stats.exact_duplicates -= 1
+            else:
+                self.stats.near_duplicates -= 1
+
+    def record_summary(self, url: str, chunk_number: int, title: str, summary: str, stored: bool):
+        """
+        记录规范块的处理结果。
+        存储成功时确认该块，并保存标题和摘要供之后链接到它的重复块复用；
+        存储失败时移除尚未确认的块，等待它的重复块重新匹配，不会链接到不存在的行。
+        """
+        chunk = self._by_location.get((url, chunk_number))
+        if chunk is None:
+            return
+        if stored:
+            chunk.title = title
+            chunk.summary = summary
+            chunk.confirmed = True
+            self._resolve(chunk, True)
+        elif not chunk.confirmed:
+            self._unregister(chunk)
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkSignatureIndex":
+        """从 JSON 文件加载索引；文件不存在时返回空索引。"""
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(chunks=[CanonicalChunk(**item, confirmed=True) for item in data["chunks"]])
+        except Exception as e:
+            print(f"加载去重索引时出错: {e}")
+            return cls()
+
+    def save(self, path: str):
+        """将已确认的规范块保存到 JSON 文件。"""
+        chunks = []
+        for chunk in self.chunks:
+            if chunk.confirmed:
+                item = asdict(chunk)
+                del item["confirmed"]
+                chunks.append(item)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"chunks": chunks}, f)
+        except Exception as e:
+            print(f"保存去重索引时出错: {e}")
@@ -0,0 +1,123 @@
+import os
+import gc
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import psutil
+
+# 内存上限（MB），包括本进程和浏览器等子进程；可在 .env 中覆盖
+MEMORY_CEILING_MB = int(os.getenv("MEMORY_CEILING_MB", "2048"))
+HIGH_WATERMARK = 0.85  # 超过上限的该比例时减半并发
+LOW_WATERMARK = 0.65  # 低于上限的该比例时逐步增加并发
+SAMPLE_INTERVAL = 0.5  # 内存采样间隔（秒）
+
+
+class AdaptiveLimiter:
+    """并发上限可以在运行时调整的信号量。"""
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max(min_limit, max_limit)
+        self.min_limit = min_limit
+        self.limit = self.max_limit
+        self.active = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个并发槽位，直到当前并发数低于上限。"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.active -= 1
+                self._condition.notify_all()
+
+    async def set_limit(self, limit: int):
+        async with self._condition:
+            self.limit = max(self.min_limit, min(self.max_limit, limit))
+            self._condition.notify_all()
+
+
+class MemoryAdaptiveDispatcher:
+    """
+    根据测得的内存占用调整爬取（浏览器）和处理（摘要、嵌入、存储）两个阶段的并发数。
+    内存超过高水位时并发减半，低于低水位时每次加一；超过上限时两个阶段都降到最低并发，
+    已在运行的任务继续完成并释放内存。
+    """
+
+    def __init__(
+        self,
+        max_crawl_concurrency: int,
+        max_process_concurrency: int,
+        memory_ceiling_mb: int = MEMORY_CEILING_MB,
+        sample_interval: float = SAMPLE_INTERVAL,
+    ):
+        self.crawl = AdaptiveLimiter(max_crawl_concurrency)
+        self.process = AdaptiveLimiter(max_process_concurrency)
+        self.ceiling = memory_ceiling_mb * 1024 * 1024
+        self.sample_interval = sample_interval
+        self.current_memory = 0
+        self.peak_memory = 0
+        self.throttle_count = 0  # 因内存压力降低并发的次数
+        self._process = psutil.Process(os.getpid())
+        self._monitor: Optional[asyncio.Task] = None
+
+    def measure_memory(self) -> int:
+        """返回本进程及其所有子进程（浏览器）的 RSS 总和（字节）。"""
+        total = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        self.current_memory = total
+        self.peak_memory = max(self.peak_memory, total)
+        return total
+
+    async def _adjust(self):
+        usage = self.measure_memory() / self.ceiling
+        if usage >= 1:
+            self.throttle_count += 1
+            gc.collect()
+            await self.crawl.set_limit(self.crawl.min_limit)
+            await self.process.set_limit(self.process.min_limit)
+        elif usage >= HIGH_WATERMARK:
+            self.throttle_count += 1
+            await self.crawl.set_limit(self.crawl.limit // 2)
+            await self.process.set_limit(self.process.limit // 2)
+        elif usage < LOW_WATERMARK:
+            await self.crawl.set_limit(self.crawl.limit + 1)
+            await self.process.set_limit(self.process.limit + 1)
+
+    async def _run_monitor(self):
+        while True:
+            try:
+                await self._adjust()
+            except Exception as e:
+                print(f"监控内存时出错: {e}")
+            await asyncio.sleep(self.sample_interval)
+
+    async def __aenter__(self) -> "MemoryAdaptiveDispatcher":
+        self._monitor = asyncio.create_task(self._run_monitor())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+        self.measure_memory()
+
+    def report(self) -> str:
+        mb = 1024 * 1024
+        return (
+            f"内存: 峰值 {self.peak_memory // mb} MB / 上限 {self.ceiling // mb} MB, "
+            f"降低并发 {self.throttle_count} 次, "
+            f"最终并发 爬取 {self.crawl.limit} / 处理 {self.process.limit}"
+        )
@@ -1,4 +1,6 @@
 import os
+import time
+import functools
 from typing import List
 from ollama import AsyncClient
 from openai import AsyncOpenAI
@@ -9,6 +11,19 @@ from supabase import Client
 
 
 llm = os.getenv('LLM_MODEL')
+docs_source = os.getenv('DOCS_SOURCE', 'crawl4ai_docs')  # 检索的数据源，对应 site_pages 中的分区
+# 向量索引的查询参数（可选）：ivfflat 的 probes 与 hnsw 的 ef_search，可用 vector_index.py sweep 调优
+vector_search_params = {
+    name: int(value)
+    for name, value in (('probes', os.getenv('VECTOR_PROBES')), ('ef_search', os.getenv('VECTOR_EF_SEARCH')))
+    if value
+}
+# 设置为快照目录（见 snapshot.py）时，直接在进程内检索本地快照，而不查询 Supabase
+local_snapshot = os.getenv('LOCAL_SNAPSHOT')
+snapshot_index = None
+if local_snapshot:
+    from snapshot import SnapshotIndex
+    snapshot_index = SnapshotIndex(local_snapshot)
 openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url="http://localhost:11434/v1")
 model = OpenAIModel(model_name=llm,openai_client=openai_client)
 
@@ -16,6 +31,20 @@ model = OpenAIModel(model_name=llm,openai_client=openai_client)
 class Crawl4AIDeps:
     supabase: Client 
     openai_client: AsyncOpenAI
+    tool_seconds: float = 0.0  # 本次运行中工具调用的累计耗时（秒），供 UI 展示
+    tool_calls: int = 0  # 本次运行中工具调用的次数
+
+def timed_tool(func):
+    """装饰工具函数，将其耗时累加到 RunContext 的依赖项中。"""
+    @functools.wraps(func)
+    async def wrapper(ctx: RunContext[Crawl4AIDeps], *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(ctx, *args, **kwargs)
+        finally:
+            ctx.deps.tool_seconds += time.perf_counter() - started
+            ctx.deps.tool_calls += 1
+    return wrapper
 
 system_prompt = """
 你是 Crawl4AI 的专家——一个开源的 AI 驱动的网络爬虫框架，专为从网页中提取结构化数据而设计，你可以访问所有相关文档，
@@ -47,6 +76,7 @@ async def get_embedding(text: str, openai_client: AsyncOpenAI) -> List[float]:
         return [0] * 768  # 出错时返回零向量
     
 @crawl4ai_expert.tool
+@timed_tool
 async def retrieve_relevant_docs(run_ctx: RunContext[Crawl4AIDeps],query: str) -> str:
     """
     根据用户的查询，使用 RAG 检索相关的文档分块。
@@ -60,21 +90,26 @@ async def retrieve_relevant_docs(run_ctx: RunContext[Crawl4AIDeps],query: str) -
     """
     try:
         query_embedding = await get_embedding(query, run_ctx.deps.openai_client)
-        result = run_ctx.deps.supabase.rpc(
-            'match_site_pages',
-            {
-                'query_embedding': query_embedding,
-                'match_count': 5,
-                'filter': {'source': 'crawl4ai_docs'}
-            }
-        ).execute()
+        if snapshot_index is not None:
+            docs = snapshot_index.search(query_embedding, 5, source=docs_source)
+        else:
+            result = run_ctx.deps.supabase.rpc(
+                'match_site_pages',
+                {
+                    'query_embedding': query_embedding,
+                    'match_count': 5,
+                    'source_name': docs_source,
+                    **vector_search_params
+                }
+            ).execute()
+            docs = result.data
 
-        if not result.data:
+        if not docs:
             return "没有找到相关的文档。"
             
         #格式化结果
         formatted_chunks = []
-        for doc in result.data:
+        for doc in docs:
             chunk_text = f"""
 # {doc['title']}
 
@@ -90,6 +125,7 @@ async def retrieve_relevant_docs(run_ctx: RunContext[Crawl4AIDeps],query: str) -
         return f"获取文档时出错: {str(e)}"
     
 @crawl4ai_expert.tool
+@timed_tool
 async def list_documentation_pages(ctx: RunContext[Crawl4AIDeps]) -> List[str]:
     """
     获取所有可用的 Crawl4AI 文档页面列表。
@@ -99,10 +135,13 @@ async def list_documentation_pages(ctx: RunContext[Crawl4AIDeps]) -> List[str]:
     """
 
     try:
-        # 查询 Supabase 获取 source 为 crawl4ai_docs 的唯一 URL
+        if snapshot_index is not None:
+            return snapshot_index.list_urls(docs_source)
+
+        # 查询 Supabase 获取当前数据源的唯一 URL
         result = ctx.deps.supabase.from_('site_pages') \
             .select('url') \
-            .eq('metadata->>source', 'crawl4ai_docs') \
+            .eq('source', docs_source) \
             .execute()
         
         if not result.data:
@@ -117,6 +156,7 @@ async def list_documentation_pages(ctx: RunContext[Crawl4AIDeps]) -> List[str]:
         return []
     
 @crawl4ai_expert.tool
+@timed_tool
 async def get_page_content(run_ctx: RunContext[Crawl4AIDeps], url: str) -> str:
     """
     通过组合所有块来检索特定文档页面的完整内容。
@@ -129,23 +169,27 @@ async def get_page_content(run_ctx: RunContext[Crawl4AIDeps], url: str) -> str:
         str: 按顺序组合所有块的完整页面内容
     """
     try:
-        # 查询 Supabase 获取指定 URL 的页面内容
-        result = run_ctx.deps.supabase.from_('site_pages') \
-            .select('title, content, chunk_number') \
-            .eq('url', url) \
-            .eq('metadata->>source', 'crawl4ai_docs') \
-            .order('chunk_number') \
-            .execute()
+        if snapshot_index is not None:
+            chunks = snapshot_index.page_chunks(url, docs_source)
+        else:
+            # 查询 Supabase 获取指定 URL 的页面内容
+            result = run_ctx.deps.supabase.from_('site_pages') \
+                .select('title, content, chunk_number') \
+                .eq('url', url) \
+                .eq('source', docs_source) \
+                .order('chunk_number') \
+                .execute()
+            chunks = result.data
         
-        if not result.data:
+        if not chunks:
             return f"没有为 URL 找到内容: {url}"
             
         # 格式化页面，包含标题和所有块内容
-        page_title = result.data[0]['title'].split(' - ')[0]  # 获取主标题
+        page_title = chunks[0]['title'].split(' - ')[0]  # 获取主标题
         formatted_content = [f"# {page_title}\n"]
         
         # 添加每个块的内容
-        for chunk in result.data:
+        for chunk in chunks:
             formatted_content.append(chunk['content'])
             
         # 将所有内容连接在一起
@@ -2,8 +2,12 @@
 create extension if not exists vector;
 
 -- Create the documentation chunks table
+-- The table is list-partitioned by source, so each documentation site gets its own
+-- physical partition with its own vector index and filtered searches never have to
+-- skip over neighbors from other sites
 create table site_pages (
-    id bigserial primary key,
+    id bigserial,
+    source varchar not null,  -- Documentation source, e.g. 'crawl4ai_docs'
     url varchar not null,
     chunk_number integer not null,
     title varchar not null,
@@ -12,22 +16,157 @@ create table site_pages (
     metadata jsonb not null default '{}'::jsonb,  -- Added metadata column
     embedding vector(768),  -- nomic-embed-text:latest embeddings are 768 dimensions
     created_at timestamp with time zone default timezone('utc'::text, now()) not null,
-    
+
+    -- The partition key must be part of the primary key and unique constraints
+    primary key (source, id),
+
     -- Add a unique constraint to prevent duplicate chunks for the same URL
-    unique(url, chunk_number)
-);
+    unique(source, url, chunk_number)
+) partition by list (source);
 
--- Create an index for better vector similarity search performance
-create index on site_pages using ivfflat (embedding vector_cosine_ops);
+-- Rows from sources without a dedicated partition land here
+create table site_pages_default partition of site_pages default;
+
+-- The vector index is not created here: an ivfflat index built on an empty table has
+-- meaningless clusters. Run `python vector_index.py build` after ingestion instead,
+-- which calls build_site_pages_vector_index below.
 
 -- Create an index on metadata for faster filtering
 create index idx_site_pages_metadata on site_pages using gin (metadata);
 
+-- Create (or reuse) the partition for a documentation source.
+-- Rows already stored in the default partition for that source are moved over.
+-- The new partition gets row level security with the same read-only policy as site_pages.
+-- Attaching a partition requires owning site_pages, so the function runs as its owner
+-- (security definer); the crawler calls it over RPC with the service key.
+create function create_site_pages_partition (
+  source_name text
+) returns text
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  partition_name text := 'site_pages_' || regexp_replace(lower(source_name), '[^a-z0-9_]', '_', 'g');
+begin
+  if exists (
+    select 1
+    from pg_inherits
+    join pg_class parent on parent.oid = pg_inherits.inhparent
+    join pg_class child on child.oid = pg_inherits.inhrelid
+    where parent.relname = 'site_pages' and child.relname = partition_name
+  ) then
+    return partition_name;
+  end if;
+
+  execute format('create table %I (like site_pages including defaults)', partition_name);
+  execute format(
+    'insert into %I select * from site_pages_default where source = %L',
+    partition_name, source_name
+  );
+  delete from site_pages_default where source = source_name;
+  execute format(
+    'alter table site_pages attach partition %I for values in (%L)',
+    partition_name, source_name
+  );
+  -- Partitions are separate tables exposed through the API: give them the same
+  -- read-only RLS policy as site_pages
+  execute format('alter table %I enable row level security', partition_name);
+  execute format(
+    'create policy "Allow public read access" on %I for select to public using (true)',
+    partition_name
+  );
+  return partition_name;
+end;
+$$;
+
+-- Only the service role may create partitions
+revoke execute on function create_site_pages_partition(text) from public, anon, authenticated;
+grant execute on function create_site_pages_partition(text) to service_role;
+
+-- Build (or rebuild) the vector index on every partition of site_pages.
+-- hnsw uses m / ef_construction; ivfflat sizes lists from each partition's row count
+-- (rows / 1000 up to 1M rows, sqrt(rows) above) unless lists is given.
+-- Partitions created later inherit the index with default options, so rebuild after ingestion.
+create function build_site_pages_vector_index (
+  method text default 'hnsw',
+  lists int default null,
+  m int default 16,
+  ef_construction int default 64
+) returns table (
+  partition_name text,
+  row_count bigint,
+  index_options text
+)
+language plpgsql
+as $$
+declare
+  part record;
+  part_rows bigint;
+  part_lists bigint;
+  options text;
+begin
+  if method not in ('hnsw', 'ivfflat') then
+    raise exception 'unsupported vector index method: %', method;
+  end if;
+
+  -- Dropping the parent index also drops the indexes attached from each partition
+  drop index if exists idx_site_pages_embedding;
+  execute format(
+    'create index idx_site_pages_embedding on only site_pages using %s (embedding vector_cosine_ops)',
+    method
+  );
+
+  for part in
+    select child.relname::text as relname
+    from pg_inherits
+    join pg_class parent on parent.oid = pg_inherits.inhparent
+    join pg_class child on child.oid = pg_inherits.inhrelid
+    where parent.relname = 'site_pages'
+  loop
+    execute format('select count(*) from %I where embedding is not null', part.relname) into part_rows;
+    if method = 'ivfflat' then
+      part_lists := coalesce(
+        lists,
+        greatest(1, case when part_rows <= 1000000 then part_rows / 1000 else floor(sqrt(part_rows))::bigint end)
+      );
+      options := format('lists = %s', part_lists);
+    else
+      options := format('m = %s, ef_construction = %s', m, ef_construction);
+    end if;
+
+    execute format(
+      'create index %I on %I using %s (embedding vector_cosine_ops) with (%s)',
+      part.relname || '_embedding_idx', part.relname, method, options
+    );
+    execute format(
+      'alter index idx_site_pages_embedding attach partition %I',
+      part.relname || '_embedding_idx'
+    );
+    execute format('analyze %I', part.relname);
+
+    partition_name := part.relname;
+    row_count := part_rows;
+    index_options := options;
+    return next;
+  end loop;
+end;
+$$;
+
 -- Create a function to search for documentation chunks
+-- Passing source_name restricts the scan to that source's partition.
+-- probes / ef_search tune the ivfflat / hnsw index for this query only;
+-- exact disables index scans to get the exact nearest neighbors (used for recall measurement).
+-- The query is run with EXECUTE so it is planned with the actual arguments every time,
+-- which keeps partition pruning and the per-query settings effective.
 create function match_site_pages (
   query_embedding vector(768),
   match_count int default 10,
-  filter jsonb DEFAULT '{}'::jsonb
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_name text default null,
+  probes int default null,
+  ef_search int default null,
+  exact boolean default false
 ) returns table (
   id bigint,
   url varchar,
@@ -40,25 +179,61 @@ create function match_site_pages (
 )
 language plpgsql
 as $$
-#variable_conflict use_column
 begin
-  return query
-  select
-    id,
-    url,
-    chunk_number,
-    title,
-    summary,
-    content,
-    metadata,
-    1 - (site_pages.embedding <=> query_embedding) as similarity
-  from site_pages
-  where metadata @> filter
-  order by site_pages.embedding <=> query_embedding
-  limit match_count;
+  if probes is not null then
+    perform set_config('ivfflat.probes', probes::text, true);
+  end if;
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', ef_search::text, true);
+  end if;
+  if exact then
+    perform set_config('enable_indexscan', 'off', true);
+  end if;
+
+  return query execute
+    'select
+      id,
+      url,
+      chunk_number,
+      title,
+      summary,
+      content,
+      metadata,
+      1 - (embedding <=> $1) as similarity
+    from site_pages
+    where metadata @> $2 and ($4::text is null or source = $4)
+    order by embedding <=> $1
+    limit $3'
+  using query_embedding, filter, match_count, source_name;
+end;
+$$;
+
+-- Corpus version: incremented by a trigger whenever site_pages is written,
+-- so cached answers can be keyed on the state of the corpus they were built from
+create table corpus_version (
+    id integer primary key default 1 check (id = 1),
+    version bigint not null default 0,
+    updated_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+insert into corpus_version default values;
+
+create function bump_corpus_version() returns trigger
+language plpgsql
+as $$
+begin
+  update corpus_version
+  set version = version + 1,
+      updated_at = timezone('utc'::text, now())
+  where id = 1;
+  return null;
 end;
 $$;
 
+create trigger site_pages_bump_corpus_version
+  after insert or update or delete or truncate on site_pages
+  for each statement execute function bump_corpus_version();
+
 -- Everything above will work for any PostgreSQL database. The below commands are for Supabase security
 
 -- Enable RLS on the table
@@ -69,4 +244,24 @@ create policy "Allow public read access"
   on site_pages
   for select
   to public
-  using (true);
\ No newline at end of file
+  using (true);
+
+-- The default partition is a table of its own and needs the same protection
+-- (partitions created by create_site_pages_partition get it automatically)
+alter table site_pages_default enable row level security;
+
+create policy "Allow public read access"
+  on site_pages_default
+  for select
+  to public
+  using (true);
+
+-- Enable RLS on the corpus version table
+alter table corpus_version enable row level security;
+
+-- Create a policy that allows anyone to read the corpus version
+create policy "Allow public read access"
+  on corpus_version
+  for select
+  to public
+  using (true);
@@ -0,0 +1,322 @@
+import os
+import json
+import struct
+import hashlib
+import time
+import argparse
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from supabase import create_client
+
+# 语料快照：site_pages 导出为一个目录
+#   manifest.json    行数、向量维度等信息
+#   chunks.parquet   列式存储的文本与元数据（zstd 压缩）
+#   embeddings.f32   连续的 float32 嵌入矩阵（行数 x 维度），可直接内存映射
+#
+#   python snapshot.py export snapshots/crawl4ai                # 从 Supabase 导出
+#   python snapshot.py import snapshots/crawl4ai --replace      # 用 COPY 批量导入 Postgres（需要 DATABASE_URL）
+#   LOCAL_SNAPSHOT=snapshots/crawl4ai streamlit run webui.py    # 直接在进程内检索快照
+
+SNAPSHOT_FORMAT_VERSION = 1
+EMBEDDING_DIM = 768  # nomic-embed-text:latest 的向量维度
+EXPORT_PAGE_SIZE = 1000  # 每次从 Supabase 读取的行数（PostgREST 默认的最大返回行数）
+INDEX_MAINTENANCE_WORK_MEM = "1GB"  # 导入后重建向量索引时使用的 maintenance_work_mem
+
+MANIFEST_FILE = "manifest.json"
+CHUNKS_FILE = "chunks.parquet"
+EMBEDDINGS_FILE = "embeddings.f32"
+
+CHUNK_SCHEMA = pa.schema([
+    ("source", pa.string()),
+    ("url", pa.string()),
+    ("chunk_number", pa.int32()),
+    ("title", pa.string()),
+    ("summary", pa.string()),
+    ("content", pa.string()),
+    ("metadata", pa.string()),  # JSON 字符串
+    ("created_at", pa.string()),
+    ("has_embedding", pa.bool_()),  # 重复块等没有嵌入的行，对应的嵌入行为全零
+])
+
+
+def parse_embedding(value) -> Optional[List[float]]:
+    """PostgREST 以字符串形式返回 vector 列，例如 '[0.1,0.2,...]'。"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def export_snapshot(path: str, source: Optional[str] = None):
+    """分页读取 site_pages，流式写入 parquet 和嵌入文件，不在内存中保留整个语料。"""
+    supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    os.makedirs(path, exist_ok=True)
+    started = time.perf_counter()
+    rows = 0
+    sources = set()
+
+    writer = pq.ParquetWriter(os.path.join(path, CHUNKS_FILE), CHUNK_SCHEMA, compression="zstd")
+    try:
+        with open(os.path.join(path, EMBEDDINGS_FILE), "wb") as embeddings_file:
+            while True:
+                query = supabase.from_('site_pages') \
+                    .select('source, url, chunk_number, title, summary, content, metadata, embedding, created_at')
+                if source:
+                    query = query.eq('source', source)
+                result = query.order('id').range(rows, rows + EXPORT_PAGE_SIZE - 1).execute()
+                if not result.data:
+                    break
+
+                embeddings = np.zeros((len(result.data), EMBEDDING_DIM), dtype=np.float32)
+                has_embedding = []
+                for i, row in enumerate(result.data):
+                    embedding = parse_embedding(row['embedding'])
+                    if embedding is not None:
+                        embeddings[i] = embedding
+                    has_embedding.append(embedding is not None)
+                    sources.add(row['source'])
+
+                writer.write_table(pa.table({
+                    "source": [row['source'] for row in result.data],
+                    "url": [row['url'] for row in result.data],
+                    "chunk_number": [row['chunk_number'] for row in result.data],
+                    "title": [row['title'] for row in result.data],
+                    "summary": [row['summary'] for row in result.data],
+                    "content": [row['content'] for row in result.data],
+                    "metadata": [json.dumps(row['metadata'], ensure_ascii=False) for row in result.data],
+                    "created_at": [row['created_at'] for row in result.data],
+                    "has_embedding": has_embedding,
+                }, schema=CHUNK_SCHEMA))
+                embeddings_file.write(embeddings.tobytes())
+
+                rows += len(result.data)
+                print(f"已导出 {rows} 行")
+                if len(result.data) < EXPORT_PAGE_SIZE:
+                    break
+    finally:
+        writer.close()
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "rows": rows,
+        "dim": EMBEDDING_DIM,
+        "dtype": "float32",
+        "sources": sorted(sources),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"快照导出完成: {path}, {rows} 行, 用时 {time.perf_counter() - started:.1f}s")
+
+
+def snapshot_version(path: str) -> str:
+    """快照的版本标识：manifest 内容的哈希，每次导出都会变化（包含导出时间）。"""
+    with open(os.path.join(path, MANIFEST_FILE), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"不支持的快照格式版本: {manifest.get('format_version')}")
+    return manifest
+
+
+def open_embeddings(path: str, manifest: Dict[str, Any]) -> np.ndarray:
+    """以只读内存映射方式打开嵌入矩阵。"""
+    if manifest["rows"] == 0:
+        return np.zeros((0, manifest["dim"]), dtype=np.float32)
+    return np.memmap(
+        os.path.join(path, EMBEDDINGS_FILE),
+        dtype=np.float32,
+        mode="r",
+        shape=(manifest["rows"], manifest["dim"])
+    )
+
+
+def vector_to_binary(embedding: np.ndarray) -> bytes:
+    """pgvector 的二进制格式：int16 维度、int16 保留位，然后是大端 float32。"""
+    return struct.pack(">HH", len(embedding), 0) + embedding.astype(">f4").tobytes()
+
+
+def copy_snapshot_rows(cur, table: pa.Table, embeddings: np.ndarray) -> int:
+    """
+    使用二进制 COPY 将快照的行写入 site_pages，返回写入的行数。
+    嵌入直接以 pgvector 的二进制格式发送，无需把每个浮点数格式化成文本。
+    """
+    from psycopg.adapt import Dumper
+    from psycopg.pq import Format
+    from psycopg.types import TypeInfo
+
+    vector_oid = TypeInfo.fetch(cur.connection, "vector").oid
+
+    class VectorDumper(Dumper):
+        format = Format.BINARY
+        oid = vector_oid
+
+        def dump(self, obj: np.ndarray) -> bytes:
+            return vector_to_binary(obj)
+
+    # 游标创建时复制了连接的适配器表，必须注册在执行 COPY 的游标上
+    cur.adapters.register_dumper(np.ndarray, VectorDumper)
+    with cur.copy(
+        "copy site_pages (source, url, chunk_number, title, summary, content, metadata, embedding, created_at) "
+        "from stdin (format binary)"
+    ) as copy:
+        copy.set_types(["text", "text", "int4", "text", "text", "text", "jsonb", vector_oid, "timestamptz"])
+        row_index = 0
+        for batch in table.to_batches():
+            columns = batch.to_pydict()
+            batch_embeddings = np.asarray(embeddings[row_index:row_index + batch.num_rows])
+            for i in range(batch.num_rows):
+                copy.write_row((
+                    columns["source"][i],
+                    columns["url"][i],
+                    columns["chunk_number"][i],
+                    columns["title"][i],
+                    columns["summary"][i],
+                    columns["content"][i],
+                    json.loads(columns["metadata"][i]),
+                    batch_embeddings[i] if columns["has_embedding"][i] else None,
+                    datetime.fromisoformat(columns["created_at"][i]),
+                ))
+            row_index += batch.num_rows
+    return row_index
+
+
+def import_snapshot(path: str, replace: bool = False, index_method: Optional[str] = "hnsw"):
+    """
+    使用 COPY 将快照批量导入 Postgres。
+    指定 index_method 时，导入前删除向量索引，导入后按该方法重建，避免逐行维护索引；
+    index_method 为 None 时保留现有索引。
+    需要可选依赖 db（psycopg）以及 DATABASE_URL 连接串。
+    """
+    try:
+        import psycopg
+    except ImportError:
+        raise SystemExit('导入快照需要 psycopg，请安装可选依赖: uv sync --extra db（或 pip install "psycopg[binary]"）')
+
+    manifest = load_manifest(path)
+    embeddings = open_embeddings(path, manifest)
+    table = pq.read_table(os.path.join(path, CHUNKS_FILE), memory_map=True)
+    started = time.perf_counter()
+
+    with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
+        with conn.cursor() as cur:
+            for source in manifest["sources"]:
+                cur.execute("select create_site_pages_partition(%s)", (source,))
+            if replace:
+                cur.execute("delete from site_pages where source = any(%s)", (manifest["sources"],))
+            if index_method:
+                # 导入后会重建索引，先删除以免 COPY 时逐行维护索引
+                cur.execute("drop index if exists idx_site_pages_embedding")
+            else:
+                print("未指定索引类型，保留现有向量索引（导入会逐行维护索引，速度较慢）")
+
+            rows = copy_snapshot_rows(cur, table, embeddings)
+            print(f"已导入 {rows} 行, 用时 {time.perf_counter() - started:.1f}s")
+
+            if index_method:
+                # 建索引不受默认语句超时限制，并使用更大的 maintenance_work_mem
+                cur.execute("select set_config('statement_timeout', '0', true)")
+                cur.execute("select set_config('maintenance_work_mem', %s, true)", (INDEX_MAINTENANCE_WORK_MEM,))
+                cur.execute("select * from build_site_pages_vector_index(%s)", (index_method,))
+                for partition_name, row_count, index_options in cur.fetchall():
+                    print(f"  {partition_name}: {row_count} 行, {index_method} ({index_options})")
+    print(f"快照导入完成, 总用时 {time.perf_counter() - started:.1f}s")
+
+
+class SnapshotIndex:
+    """
+    在进程内打开快照作为本地检索索引。
+    嵌入矩阵通过内存映射读取，文本保留在 Arrow 表中，只有返回的结果才会转换成 Python 对象；
+    使用与 match_site_pages 相同的余弦相似度做精确检索。
+    """
+
+    def __init__(self, path: str):
+        manifest = load_manifest(path)
+        self.version = snapshot_version(path)
+        self.embeddings = open_embeddings(path, manifest)
+        self.table = pq.read_table(os.path.join(path, CHUNKS_FILE), memory_map=True)
+        norms = np.linalg.norm(self.embeddings, axis=1)
+        # 没有嵌入的行不参与检索，与数据库中 embedding 为 NULL 的行一致
+        self.searchable = self.table.column("has_embedding").to_numpy(zero_copy_only=False).astype(bool)
+        self.inverse_norms = np.where(self.searchable & (norms > 0), 1 / np.maximum(norms, 1e-12), 0).astype(np.float32)
+        self._source_masks: Dict[str, np.ndarray] = {}
+
+    def _source_mask(self, source: str) -> np.ndarray:
+        if source not in self._source_masks:
+            mask = pc.equal(self.table.column("source"), source)
+            self._source_masks[source] = mask.to_numpy(zero_copy_only=False).astype(bool)
+        return self._source_masks[source]
+
+    @staticmethod
+    def _format(row: Dict[str, Any], similarity: Optional[float] = None) -> Dict[str, Any]:
+        doc = {
+            "url": row["url"],
+            "chunk_number": row["chunk_number"],
+            "title": row["title"],
+            "summary": row["summary"],
+            "content": row["content"],
+            "metadata": json.loads(row["metadata"]),
+        }
+        if similarity is not None:
+            doc["similarity"] = similarity
+        return doc
+
+    def search(self, query_embedding: List[float], match_count: int = 10, source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """返回与查询向量余弦相似度最高的文本块，格式与 match_site_pages 的结果一致。"""
+        candidates = self.searchable if source is None else self.searchable & self._source_mask(source)
+        candidate_indices = np.flatnonzero(candidates)
+        if len(candidate_indices) == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+        scores = (self.embeddings[candidate_indices] @ query) * self.inverse_norms[candidate_indices] / query_norm
+        count = min(match_count, len(candidate_indices))
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+        rows = self.table.take(candidate_indices[top]).to_pylist()
+        return [self._format(row, float(scores[i])) for row, i in zip(rows, top)]
+
+    def list_urls(self, source: str) -> List[str]:
+        urls = self.table.column("url").filter(self._source_mask(source))
+        return sorted(pc.unique(urls).to_pylist())
+
+    def page_chunks(self, url: str, source: str) -> List[Dict[str, Any]]:
+        """按 chunk_number 顺序返回页面的所有文本块。"""
+        mask = pc.and_(pc.equal(self.table.column("url"), url), pa.array(self._source_mask(source)))
+        page = self.table.filter(mask).sort_by("chunk_number")
+        return [self._format(row) for row in page.to_pylist()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="site_pages 语料快照导出与导入")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="从 Supabase 导出快照")
+    export_parser.add_argument("path", help="快照目录")
+    export_parser.add_argument("--source", default=None, help="只导出该数据源")
+
+    import_parser = subparsers.add_parser("import", help="使用 COPY 将快照导入 Postgres")
+    import_parser.add_argument("path", help="快照目录")
+    import_parser.add_argument("--replace", action="store_true", help="先删除快照中数据源的已有数据")
+    import_parser.add_argument("--index", choices=["hnsw", "ivfflat", "none"], default="hnsw", help="导入后构建的向量索引")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_snapshot(args.path, args.source)
+    else:
+        import_snapshot(args.path, args.replace, None if args.index == "none" else args.index)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#测试文本块去重索引：完全重复、近似重复、同一位置重新爬取、页面内重复、存储失败以及保存/加载
+
+import os
+import asyncio
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import ChunkSignatureIndex
+
+BASE_TEXT = " ".join(f"word{i}" for i in range(400))
+
+
+def add_stored(index: ChunkSignatureIndex, text: str, url: str, chunk_number: int = 0):
+    """登记一个新块并模拟其成功存储。"""
+    assert index.find_canonical(text, url, chunk_number) is None
+    index.record_summary(url, chunk_number, f"title {url}", f"summary {url}", stored=True)
+
+
+def test_exact_duplicate():
+    index = ChunkSignatureIndex()
+    add_stored(index, BASE_TEXT, "a")
+    # 只有空白和大小写不同，视为完全重复
+    canonical = index.find_canonical("  " + BASE_TEXT.upper() + "\n", "b", 0)
+    assert canonical is not None and canonical.url == "a"
+    assert canonical.title == "title a"
+    assert index.stats.exact_duplicates == 1
+
+
+def test_near_duplicate():
+    index = ChunkSignatureIndex()
+    add_stored(index, BASE_TEXT, "a")
+    canonical = index.find_canonical(BASE_TEXT.replace("word200", "changed"), "b", 0)
+    assert canonical is not None and canonical.url == "a"
+    assert index.stats.near_duplicates == 1
+
+
+def test_different_text_is_not_duplicate():
+    index = ChunkSignatureIndex()
+    add_stored(index, BASE_TEXT, "a")
+    other = " ".join(f"other{i}" for i in range(400))
+    assert index.find_canonical(other, "b", 0) is None
+    assert index.stats.saved_calls == 0
+
+
+def test_same_location_is_not_duplicate_of_itself():
+    index = ChunkSignatureIndex()
+    add_stored(index, BASE_TEXT, "a")
+    # 重新爬取同一位置的相同内容
+    assert index.find_canonical(BASE_TEXT, "a", 0) is None
+    # 同一位置的内容变化后，旧签名被替换
+    changed = " ".join(f"new{i}" for i in range(400))
+    assert index.find_canonical(changed, "a", 0) is None
+    index.record_summary("a", 0, "t", "s", stored=True)
+    assert len(index.chunks) == 1
+    assert index.find_canonical(BASE_TEXT, "b", 0) is None
+
+
+async def store_page(index: ChunkSignatureIndex, url: str, texts, stored: bool = True):
+    """按 process_and_store_document 的方式并发处理一个页面，返回每个块匹配到的规范块 URL 和编号。"""
+    async def handle(text: str, chunk_number: int):
+        canonical = await index.resolve_canonical(text, url, chunk_number)
+        if canonical is not None:
+            return (canonical.url, canonical.chunk_number)
+        await asyncio.sleep(0)  # 模拟摘要、嵌入和存储
+        index.record_summary(url, chunk_number, "t", "s", stored)
+        return None
+
+    return await asyncio.gather(*(handle(text, i) for i, text in enumerate(texts)))
+
+
+def test_duplicate_within_one_page():
+    index = ChunkSignatureIndex()
+    other = " ".join(f"other{i}" for i in range(400))
+    results = asyncio.run(store_page(index, "a", [BASE_TEXT, other, BASE_TEXT]))
+    assert results == [None, None, ("a", 0)]
+    assert index.stats.exact_duplicates == 1
+    assert len(index.chunks) == 2
+
+
+def test_duplicate_across_concurrent_pages():
+    index = ChunkSignatureIndex()
+
+    async def crawl():
+        return await asyncio.gather(
+            store_page(index, "a", [BASE_TEXT]),
+            store_page(index, "b", [BASE_TEXT.replace("word200", "changed")]),
+        )
+
+    assert asyncio.run(crawl()) == [[None], [("a", 0)]]
+    assert index.stats.near_duplicates == 1
+
+
+def test_unstored_chunk_is_never_canonical():
+    index = ChunkSignatureIndex()
+
+    async def crawl():
+        # a 的存储失败：等待它的 b 重新匹配并成为规范块，c 链接到 b
+        first = await asyncio.gather(
+            store_page(index, "a", [BASE_TEXT], stored=False),
+            store_page(index, "b", [BASE_TEXT]),
+        )
+        return first, await store_page(index, "c", [BASE_TEXT])
+
+    first, second = asyncio.run(crawl())
+    assert first == [[None], [None]]
+    assert second == [("b", 0)]
+    assert [(chunk.url, chunk.confirmed) for chunk in index.chunks] == [("b", True)]
+    assert index.stats.exact_duplicates == 1
+
+
+def test_save_and_load_round_trip():
+    index = ChunkSignatureIndex()
+    add_stored(index, BASE_TEXT, "a")
+    # 未确认的块不会被保存
+    index.find_canonical(" ".join(f"pending{i}" for i in range(400)), "p", 0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dedup", "source.json")
+        index.save(path)
+        loaded = ChunkSignatureIndex.load(path)
+    assert [(chunk.url, chunk.chunk_number) for chunk in loaded.chunks] == [("a", 0)]
+    canonical = loaded.find_canonical(BASE_TEXT.replace("word10", "changed"), "b", 0)
+    assert canonical is not None and canonical.url == "a" and canonical.summary == "summary a"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
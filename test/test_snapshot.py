@@ -0,0 +1,106 @@
+#测试语料快照：向量的二进制格式、本地快照检索，以及二进制 COPY 导入
+#COPY 导入需要一个已执行 site_pages.sql 的数据库：设置 TEST_DATABASE_URL 后运行，测试在事务中进行并最终回滚
+
+import os
+import sys
+import json
+import struct
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snapshot import (
+    CHUNK_SCHEMA, CHUNKS_FILE, EMBEDDINGS_FILE, EMBEDDING_DIM, MANIFEST_FILE, SNAPSHOT_FORMAT_VERSION,
+    SnapshotIndex, copy_snapshot_rows, load_manifest, open_embeddings, vector_to_binary,
+)
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SOURCE = "snapshot_test"
+
+
+def write_snapshot(path: str, rows: int = 6) -> np.ndarray:
+    """写入一个合成快照：每 3 个块属于同一页面，最后一行没有嵌入。"""
+    embeddings = np.random.default_rng(0).standard_normal((rows, EMBEDDING_DIM)).astype(np.float32)
+    embeddings[-1] = 0
+    pq.write_table(pa.table({
+        "source": [SOURCE] * rows,
+        "url": [f"https://example.com/page{i // 3}" for i in range(rows)],
+        "chunk_number": [i % 3 for i in range(rows)],
+        "title": [f"title {i}" for i in range(rows)],
+        "summary": [f"summary {i}" for i in range(rows)],
+        "content": [f"content {i}" for i in range(rows)],
+        "metadata": [json.dumps({"source": SOURCE, "chunk": i}) for i in range(rows)],
+        "created_at": ["2025-01-01T00:00:00+00:00"] * rows,
+        "has_embedding": [i < rows - 1 for i in range(rows)],
+    }, schema=CHUNK_SCHEMA), os.path.join(path, CHUNKS_FILE))
+    embeddings.tofile(os.path.join(path, EMBEDDINGS_FILE))
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "rows": rows,
+            "dim": EMBEDDING_DIM,
+            "dtype": "float32",
+            "sources": [SOURCE],
+            "created_at": "2025-01-01T00:00:00+00:00",
+        }, f)
+    return embeddings
+
+
+def test_vector_to_binary():
+    embedding = np.array([1.0, -2.5, 0.25], dtype=np.float32)
+    data = vector_to_binary(embedding)
+    assert struct.unpack(">HH", data[:4]) == (3, 0)
+    assert np.array_equal(np.frombuffer(data[4:], dtype=">f4"), embedding)
+
+
+def test_local_snapshot_search():
+    with tempfile.TemporaryDirectory() as path:
+        embeddings = write_snapshot(path)
+        index = SnapshotIndex(path)
+        docs = index.search(embeddings[4].tolist(), 2, SOURCE)
+        assert docs[0]["content"] == "content 4"
+        # 没有嵌入的行不参与检索
+        assert all(doc["content"] != "content 5" for doc in index.search(embeddings[4].tolist(), 10, SOURCE))
+        assert index.page_chunks("https://example.com/page1", SOURCE)[0]["chunk_number"] == 0
+
+
+def test_copy_snapshot_rows():
+    if not TEST_DATABASE_URL:
+        print("未设置 TEST_DATABASE_URL，跳过 COPY 导入测试")
+        return
+    import psycopg
+
+    with tempfile.TemporaryDirectory() as path:
+        embeddings = write_snapshot(path)
+        table = pq.read_table(os.path.join(path, CHUNKS_FILE))
+        snapshot_embeddings = open_embeddings(path, load_manifest(path))
+        with psycopg.connect(TEST_DATABASE_URL) as conn:
+            try:
+                # 与 import_snapshot 相同：先打开游标，再在游标上执行 COPY
+                with conn.cursor() as cur:
+                    cur.execute("select create_site_pages_partition(%s)", (SOURCE,))
+                    assert copy_snapshot_rows(cur, table, snapshot_embeddings) == 6
+                    cur.execute(
+                        "select chunk_number, metadata, embedding::text from site_pages "
+                        "where source = %s and url = %s order by chunk_number",
+                        (SOURCE, "https://example.com/page1")
+                    )
+                    rows = cur.fetchall()
+            finally:
+                conn.rollback()
+
+    assert [row[0] for row in rows] == [0, 1, 2]
+    assert rows[0][1] == {"source": SOURCE, "chunk": 3}
+    assert np.allclose(json.loads(rows[0][2]), embeddings[3], atol=1e-6)
+    assert rows[2][2] is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,154 @@
+import os
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from typing import List, Dict, Any, Optional
+
+from supabase import create_client, Client
+
+from rag_agent import get_embedding, openai_client, docs_source
+
+# 向量索引维护与调优工具
+#   python vector_index.py build --method hnsw              # 摄取完成后构建/重建向量索引
+#   python vector_index.py build --method ivfflat           # lists 按每个分区的行数自动计算
+#   python vector_index.py sweep --queries questions.txt    # 对比精确检索，测量召回率与延迟
+
+supabase: Client = create_client(
+    os.getenv("SUPABASE_URL"),
+    os.getenv("SUPABASE_SERVICE_KEY")
+)
+
+# 各索引类型默认扫描的查询参数取值
+DEFAULT_SWEEP_VALUES = {
+    "ivfflat": [1, 2, 5, 10, 20, 40],
+    "hnsw": [10, 20, 40, 80, 160, 320],
+}
+
+
+def build_index(method: str, lists: Optional[int], m: int, ef_construction: int, maintenance_work_mem: str):
+    """
+    在 site_pages 的每个分区上构建向量索引。
+    通过 DATABASE_URL 直连 Postgres，而不是走 PostgREST RPC：API 角色的 statement_timeout
+    和默认的 maintenance_work_mem 对建索引来说太小。需要可选依赖 db（psycopg）。
+    """
+    try:
+        import psycopg
+    except ImportError:
+        raise SystemExit('构建向量索引需要 psycopg，请安装可选依赖: uv sync --extra db（或 pip install "psycopg[binary]"）')
+
+    started = time.perf_counter()
+    with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
+        with conn.cursor() as cur:
+            cur.execute("select set_config('statement_timeout', '0', true)")
+            cur.execute("select set_config('maintenance_work_mem', %s, true)", (maintenance_work_mem,))
+            cur.execute(
+                "select * from build_site_pages_vector_index(%s, %s, %s, %s)",
+                (method, lists, m, ef_construction)
+            )
+            for partition_name, row_count, index_options in cur.fetchall():
+                print(f"  {partition_name}: {row_count} 行, {method} ({index_options})")
+    print(f"向量索引构建完成，用时 {time.perf_counter() - started:.1f}s")
+
+
+def load_sample_queries(queries_path: Optional[str], sample_size: int, source: str) -> List[str]:
+    """
+    获取用于调优的查询。
+    优先使用文件中的真实问题（每行一个）；没有时从该数据源的文本块摘要中随机抽样。
+    """
+    if queries_path:
+        with open(queries_path, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        result = supabase.from_('site_pages') \
+            .select('summary') \
+            .eq('source', source) \
+            .execute()
+        queries = [row['summary'] for row in result.data or []]
+    if len(queries) > sample_size:
+        queries = random.sample(queries, sample_size)
+    return queries
+
+
+def search(embedding: List[float], source: str, k: int, **search_params) -> List[Dict[str, Any]]:
+    """调用 match_site_pages 执行一次检索。"""
+    result = supabase.rpc(
+        'match_site_pages',
+        {
+            'query_embedding': embedding,
+            'match_count': k,
+            'source_name': source,
+            **search_params
+        }
+    ).execute()
+    return result.data or []
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def sweep(method: str, values: List[int], queries_path: Optional[str], sample_size: int, k: int, source: str):
+    """
+    对一组查询参数做召回率与延迟的扫描。
+    以关闭索引的精确检索结果为基准，计算每个取值下的平均 recall@k 和 p50/p95 延迟
+    （延迟包含到 Supabase 的网络往返）。
+    """
+    queries = load_sample_queries(queries_path, sample_size, source)
+    if not queries:
+        print("没有可用于调优的查询")
+        return
+    print(f"使用 {len(queries)} 个查询, k={k}, 数据源: {source}")
+
+    embeddings = await asyncio.gather(*(get_embedding(query, openai_client) for query in queries))
+    exact_ids = [
+        {doc['id'] for doc in search(embedding, source, k, exact=True)}
+        for embedding in embeddings
+    ]
+
+    param_name = "probes" if method == "ivfflat" else "ef_search"
+    print(f"\n{param_name:>10} {'recall@' + str(k):>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for value in values:
+        recalls = []
+        latencies = []
+        for embedding, expected in zip(embeddings, exact_ids):
+            started = time.perf_counter()
+            docs = search(embedding, source, k, **{param_name: value})
+            latencies.append((time.perf_counter() - started) * 1000)
+            if expected:
+                recalls.append(len(expected & {doc['id'] for doc in docs}) / len(expected))
+        mean_recall = statistics.mean(recalls) if recalls else 0.0
+        print(f"{value:>10} {mean_recall:>10.3f} {percentile(latencies, 50):>10.1f} {percentile(latencies, 95):>10.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="site_pages 向量索引维护与调优")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="构建或重建向量索引")
+    build_parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    build_parser.add_argument("--lists", type=int, default=None, help="ivfflat 的 lists，默认按行数计算")
+    build_parser.add_argument("--m", type=int, default=16, help="hnsw 的 m")
+    build_parser.add_argument("--ef-construction", type=int, default=64, help="hnsw 的 ef_construction")
+    build_parser.add_argument("--maintenance-work-mem", default="1GB", help="建索引时使用的 maintenance_work_mem")
+
+    sweep_parser = subparsers.add_parser("sweep", help="对比精确检索，扫描 probes / ef_search")
+    sweep_parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw", help="当前索引的类型")
+    sweep_parser.add_argument("--values", type=int, nargs="+", default=None, help="要测试的 probes / ef_search 取值")
+    sweep_parser.add_argument("--queries", default=None, help="真实问题文件，每行一个")
+    sweep_parser.add_argument("--sample", type=int, default=50, help="最多使用的查询数量")
+    sweep_parser.add_argument("--k", type=int, default=5, help="每次检索返回的文本块数量")
+    sweep_parser.add_argument("--source", default=docs_source, help="要测试的数据源")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build_index(args.method, args.lists, args.m, args.ef_construction, args.maintenance_work_mem)
+    else:
+        values = args.values or DEFAULT_SWEEP_VALUES[args.method]
+        await sweep(args.method, values, args.queries, args.sample, args.k, args.source)
+
+if __name__ == "__main__":
+    asyncio.run(main())
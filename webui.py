@@ -2,6 +2,8 @@ from __future__ import annotations
 from typing import Literal, TypedDict
 import asyncio
 import os
+import re
+import time
 import streamlit as st
 import json
 from supabase import Client
@@ -20,13 +22,32 @@ from pydantic_ai.messages import (
     RetryPromptPart,
     ModelMessagesTypeAdapter
 )
-from rag_agent import crawl4ai_expert, Crawl4AIDeps
-# 加载环境变量
-openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url="http://localhost:11434/v1")
-supabase: Client = Client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
+from rag_agent import crawl4ai_expert, Crawl4AIDeps, llm, snapshot_index
+from answer_cache import AnswerCache, get_corpus_version, replay_answer
+
+# 流式渲染的帧间隔（秒）与字符阈值：满足任一条件才刷新一次 UI
+RENDER_INTERVAL = 1 / 15
+RENDER_MIN_CHARS = 512
+# 代码块围栏：``` 或 ~~~ 开头（允许更长的围栏）的行
+CODE_FENCE = re.compile(r"^ {0,3}(?:`{3,}|~{3,})", re.MULTILINE)
+
+@st.cache_resource
+def get_openai_client() -> AsyncOpenAI:
+    """进程级缓存的 OpenAI 客户端，避免每次 Streamlit 重跑脚本时重新创建。"""
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url="http://localhost:11434/v1")
+
+@st.cache_resource
+def get_supabase_client() -> Client:
+    """进程级缓存的 Supabase 客户端。"""
+    return Client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_SERVICE_KEY")
+    )
+
+@st.cache_resource
+def get_answer_cache() -> AnswerCache:
+    """进程级共享的完整回答缓存，所有会话共用。"""
+    return AnswerCache()
 
 class ChatMessage(TypedDict):
     """发送到浏览器/API 的消息格式。"""
@@ -52,16 +73,99 @@ def display_message_part(part):
         with st.chat_message("assistant"):
             st.markdown(part.content)          
 
-async def run_agent_with_streaming(user_input: str):
+def format_metrics(metrics: dict) -> str:
+    """将单次回答的延迟指标格式化为一行说明文字。"""
+    if metrics.get("cached"):
+        return f"⚡ 缓存回答 · 首字延迟 {metrics['ttft']:.2f}s · 总耗时 {metrics['total']:.2f}s"
+    return (
+        f"首字延迟 {metrics['ttft']:.2f}s · "
+        f"{metrics['tokens_per_sec']:.1f} tokens/s · "
+        f"工具调用 {metrics['tool_calls']} 次 / {metrics['tool_seconds']:.2f}s · "
+        f"总耗时 {metrics['total']:.2f}s"
+    )
+
+class StreamRenderer:
+    """
+    增量渲染流式文本。
+    已完成的段落只渲染一次并固定在容器中，只有末尾未完成的段落会被反复刷新，
+    并且刷新按帧率或字符阈值合并，避免每个增量都重绘整段回答。
+    流结束后用一次 st.markdown 渲染全文，使最终结果与从历史记录渲染时一致。
+    """
+
+    def __init__(self, interval: float = RENDER_INTERVAL, min_chars: int = RENDER_MIN_CHARS):
+        self.interval = interval
+        self.min_chars = min_chars
+        self.placeholder = st.empty()  # 流结束后整体替换为完整回答
+        body = self.placeholder.container()
+        self.committed = body.container()  # 已完成的段落
+        self.tail_placeholder = body.empty()  # 正在生成的末尾段落
+        self.text = ""
+        self.tail = ""
+        self.pending = 0
+        self.last_render = 0.0
+
+    def feed(self, delta: str):
+        """追加增量文本，并在需要时刷新 UI。"""
+        self.text += delta
+        self.tail += delta
+        self.pending += len(delta)
+        now = time.perf_counter()
+        if self.pending >= self.min_chars or now - self.last_render >= self.interval:
+            self._render(now)
+
+    def flush(self):
+        """流结束后清除分段渲染的内容，一次性渲染完整回答。"""
+        self.placeholder.markdown(self.text)
+
+    def _render(self, now: float):
+        # 把末尾中已完成的段落（不在未闭合的代码块内）移入固定容器
+        split = self.tail.rfind("\n\n")
+        if split != -1 and len(CODE_FENCE.findall(self.tail[:split])) % 2 == 0:
+            self.committed.markdown(self.tail[:split])
+            self.tail = self.tail[split + 2:]
+        self.tail_placeholder.markdown(self.tail)
+        self.pending = 0
+        self.last_render = now
+
+def record_metrics(metrics: dict):
+    """保存最新一条回答的延迟指标，并显示在回答下方。"""
+    st.session_state.answer_metrics[len(st.session_state.messages) - 1] = metrics
+    st.caption(format_metrics(metrics))
+
+async def replay_cached_answer(content: str):
+    """以流的形式重放缓存的回答，并将其加入对话。"""
+    started = time.perf_counter()
+    first_token_at = None
+    renderer = StreamRenderer()
+    async for chunk in replay_answer(content):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        renderer.feed(chunk)
+    renderer.flush()
+    finished = time.perf_counter()
+    st.session_state.messages.append(
+        ModelResponse(parts=[TextPart(content=content)])
+    )
+    record_metrics({
+        "cached": True,
+        "ttft": (first_token_at or finished) - started,
+        "total": finished - started,
+    })
+
+async def run_agent_with_streaming(user_input: str) -> str:
     """
     使用流式文本运行代理，处理用户输入提示，
     同时在 `st.session_state.messages` 中维护整个对话。
+    返回完整的回答文本。
     """
     # 准备依赖项
     deps = Crawl4AIDeps(
-        supabase=supabase,
-        openai_client=openai_client
+        supabase=get_supabase_client(),
+        openai_client=get_openai_client()
     )
+    started = time.perf_counter()
+    first_token_at = None
+    delta_count = 0
     # 在流中运行代理
     async with crawl4ai_expert.run_stream(
         user_input,
@@ -70,11 +174,18 @@ async def run_agent_with_streaming(user_input: str):
     ) as result:
         # 我们将收集部分文本以逐步显示
         partial_text = ""
-        message_placeholder = st.empty()
+        renderer = StreamRenderer()
         # 渲染部分文本随着它的到达
-        async for chunk in result.stream_text(delta=True):
+        # 关闭默认的 0.1s 去抖，使每个增量对应模型流式返回的一个分片
+        # （Ollama 的 OpenAI 兼容接口每个分片为一个 token），从而按分片统计生成速度
+        async for chunk in result.stream_text(delta=True, debounce_by=None):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            delta_count += 1
             partial_text += chunk
-            message_placeholder.markdown(partial_text)
+            renderer.feed(chunk)
+        renderer.flush()
+        finished = time.perf_counter()
         # 流结束后，我们现在有一个最终结果。
         # 添加此运行的新消息，排除用户提示消息
         filtered_messages = [msg for msg in result.new_messages() 
@@ -85,6 +196,17 @@ async def run_agent_with_streaming(user_input: str):
         st.session_state.messages.append(
             ModelResponse(parts=[TextPart(content=partial_text)])
         )
+    # 记录并显示本次回答的延迟指标
+    first_token_at = first_token_at or finished
+    generation_seconds = finished - first_token_at
+    record_metrics({
+        "ttft": first_token_at - started,
+        "tokens_per_sec": delta_count / generation_seconds if generation_seconds > 0 else 0.0,
+        "tool_calls": deps.tool_calls,
+        "tool_seconds": deps.tool_seconds,
+        "total": finished - started,
+    })
+    return partial_text
 
 async def main():
     st.title("RAG-OWU 聊天机器人")
@@ -92,13 +214,24 @@ async def main():
     # 如果会话状态中没有聊天历史，则初始化
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    # 每条回答的延迟指标，按其在消息列表中的索引保存
+    if "answer_metrics" not in st.session_state:
+        st.session_state.answer_metrics = {}
+    # 侧边栏：答案缓存控制
+    answer_cache = get_answer_cache()
+    use_cache = st.sidebar.checkbox("使用答案缓存", value=True, help="取消勾选可跳过缓存，强制重新生成回答")
+    if st.sidebar.button("清空答案缓存"):
+        answer_cache.clear()
+    st.sidebar.caption(f"已缓存回答: {len(answer_cache)}")
     # 显示迄今为止的对话中的所有消息
     # 每条消息要么是 ModelRequest 或 ModelResponse。
     # 我们遍历它们的部分以决定如何显示它们。
-    for msg in st.session_state.messages:
+    for index, msg in enumerate(st.session_state.messages):
         if isinstance(msg, ModelRequest) or isinstance(msg, ModelResponse):
             for part in msg.parts:
                 display_message_part(part)
+        if index in st.session_state.answer_metrics:
+            st.caption(format_metrics(st.session_state.answer_metrics[index]))
     # 用户聊天输入
     user_input = st.chat_input("您对 Crawl4AI 有什么问题？")
     if user_input:
@@ -110,10 +243,27 @@ async def main():
         # 在 UI 中显示用户提示
         with st.chat_message("user"):
             st.markdown(user_input)
+        # 只对独立的问题（没有之前的对话）使用缓存，追问的回答依赖上下文
+        cache_key = None
+        if use_cache and len(st.session_state.messages) == 1:
+            # 使用本地快照检索时，回答来自快照而不是 Supabase，语料版本也取自快照
+            if snapshot_index is not None:
+                corpus_version = f"snapshot:{snapshot_index.version}"
+            else:
+                corpus_version = get_corpus_version(get_supabase_client())
+            if corpus_version is not None:
+                cache_key = AnswerCache.make_key(user_input, llm, corpus_version)
+        cached = answer_cache.get(cache_key) if cache_key else None
         # 在流式传输时显示助手的部分响应
         with st.chat_message("assistant"):
-            # 实际运行代理，流式传输文本
-            await run_agent_with_streaming(user_input)
+            if cached:
+                # 命中缓存，直接重放之前的回答
+                await replay_cached_answer(cached.content)
+            else:
+                # 实际运行代理，流式传输文本
+                answer = await run_agent_with_streaming(user_input)
+                if cache_key:
+                    answer_cache.put(cache_key, answer)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file